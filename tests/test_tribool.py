@@ -1,13 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import contextlib
 import copy
+import os
 import pickle
+import random
+import shutil
+import tempfile
 
 import nose
 from nose.tools import raises
 
 from .context import tribool
-from tribool import Tribool
+from tribool import Tribool, TriboolArray, TriboolReader, TriboolWriter
+from tribool import TriboolFilter, TriboolRules, TriboolTimeWindow
+from tribool import TriboolWindow
 
 def test_init():
     """Test initializer values for Tribool."""
@@ -157,5 +164,441 @@ def test_check():
     for value in (True, False, None):
         Tribool(value)._check()
 
+def test_convert():
+    values = [True, False, None, 'True', 'Maybe', Tribool(False)] * 3
+    result = Tribool.convert(values)
+    assert all(lhs is Tribool(rhs) for lhs, rhs in zip(result, values))
+
+def test_convert_strict():
+    result = Tribool.convert([True, False, None], coerce='strict')
+    assert result == [Tribool(True), Tribool(False), Tribool(None)]
+
+@raises(ValueError)
+def test_convert_strict_raises():
+    Tribool.convert([True, 'True'], coerce='strict')
+
+def test_convert_mapping():
+    mapping = {1: True, 0: False, 'yes': True, 'no': False, 'maybe': None}
+    values = [1, 0, 'yes', 'no', 'maybe', True, None]
+    expected = [True, False, True, False, None, True, None]
+    result = Tribool.convert(values, coerce=mapping)
+    assert [value.value for value in result] == expected
+
+@raises(ValueError)
+def test_convert_mapping_raises():
+    Tribool.convert(['True'], coerce={1: True})
+
+@raises(ValueError)
+def test_convert_unhashable_raises():
+    Tribool.convert([True, []])
+
+@raises(ValueError)
+def test_convert_coerce_raises():
+    Tribool.convert([True], coerce='loose')
+
+def test_convert_packed():
+    values = [True, False, None, 'Unknown', False]
+    result = Tribool.convert(values, packed=True)
+    assert isinstance(result, TriboolArray)
+    assert len(result) == 5
+    assert all(lhs is Tribool(rhs) for lhs, rhs in zip(result, values))
+
+def test_array():
+    values = [True, None, False, True, True, None]
+    array = TriboolArray(values[:1])
+    array.append(values[1])
+    array.append('yes', coerce={'yes': True})
+    assert array[-1] is Tribool(True)
+    array = TriboolArray(values[:2])
+    array.extend(values[2:])
+    assert len(array) == 6
+    assert [value.value for value in array] == values
+    assert array[0] is Tribool(True)
+    assert array[-1] is Tribool(None)
+    assert [value.value for value in array[1:4]] == values[1:4]
+    assert array.codes() == b'\x01\x02\x00\x01\x01\x02'
+    assert len(array.tobytes()) == 2
+    assert repr(array[:2]) == 'TriboolArray([True, None])'
+
+@raises(ValueError)
+def test_array_append_raises():
+    TriboolArray().append('True', coerce='strict')
+
+@raises(IndexError)
+def test_array_index_raises():
+    TriboolArray([True])[1]
+
+def test_array_bytes():
+    array = TriboolArray([None, False, True] * 5)
+    copy = TriboolArray.frombytes(array.tobytes(), len(array))
+    assert copy.codes() == array.codes()
+    assert TriboolArray.fromcodes(array.codes()).tobytes() == array.tobytes()
+
+@raises(ValueError)
+def test_array_frombytes_raises():
+    TriboolArray.frombytes(b'\xff', 4)
+
+@contextlib.contextmanager
+def _temporary_path():
+    directory = tempfile.mkdtemp()
+    try:
+        yield os.path.join(directory, 'test.log')
+    finally:
+        shutil.rmtree(directory)
+
+def _read_values(path):
+    with TriboolReader(path) as reader:
+        return [value.value for value in reader]
+
+def test_log():
+    values = [True, False, None] * 10 + [True] * 40 + [None] * 3
+
+    with _temporary_path() as path:
+        with TriboolWriter(path, chunk_size=16) as writer:
+            writer.write(values[:50])
+            writer.write(TriboolArray(values[50:60]))
+            writer.append(values[60])
+            assert len(writer) == 61
+
+        with TriboolWriter(path) as writer:
+            assert writer.chunk_size == 16
+            writer.write(values[61:])
+
+        with TriboolReader(path) as reader:
+            assert len(reader) == len(values)
+            assert [value.value for value in reader] == values
+            part = reader.read(10, 40)
+            assert [value.value for value in part] == values[10:40]
+            assert reader[33] is Tribool(values[33])
+            assert reader[-1] is Tribool(None)
+            part = reader[1:30:4]
+            assert isinstance(part, TriboolArray)
+            assert [value.value for value in part] == values[1:30:4]
+            chunks = list(reader.chunks())
+            assert len(chunks) == 5
+            assert all(isinstance(chunk, TriboolArray) for chunk in chunks)
+            assert [len(chunk) for chunk in chunks] == [16, 16, 16, 16, 9]
+
+def test_log_recover():
+    with _temporary_path() as path:
+        with TriboolWriter(path, chunk_size=4) as writer:
+            writer.write([True, None, False, None, True])
+
+        with open(path, 'ab') as writer:
+            writer.write(b'interrupted write')
+
+        assert _read_values(path) == [True, None, False, None, True]
+
+        with TriboolWriter(path) as writer:
+            writer.write([False])
+
+        assert _read_values(path) == [True, None, False, None, True, False]
+
+def test_log_flush():
+    with _temporary_path() as path:
+        writer = TriboolWriter(path, chunk_size=4)
+        writer.write([True, None, False, None, True, False])
+        writer.flush()
+
+        assert _read_values(path) == [True, None, False, None, True, False]
+
+        writer.write([True, True, None])
+        writer.flush()
+        writer.close()
+
+        assert _read_values(path) == [True, None, False, None, True, False,
+                                      True, True, None]
+
+def test_log_flush_size():
+    random.seed(0)
+    values = [random.choice([True, False, None]) for _ in range(20000)]
+
+    with _temporary_path() as path:
+        with TriboolWriter(path) as writer:
+            for start in range(0, len(values), 100):
+                writer.write(values[start:start + 100])
+                writer.flush()
+
+        assert os.path.getsize(path) < 150 * len(values) // 100
+        assert _read_values(path) == values
+
+def test_log_many_flushes():
+    random.seed(0)
+    values = []
+
+    with _temporary_path() as path:
+        for _ in range(3):
+            with TriboolWriter(path, chunk_size=50) as writer:
+                for _ in range(200):
+                    part = [random.choice([True, False, None])
+                            for _ in range(random.randint(0, 20))]
+                    writer.write(part)
+                    writer.flush()
+                    values.extend(part)
+
+        assert _read_values(path) == values
+
+def test_log_reopen():
+    with _temporary_path() as path:
+        with TriboolWriter(path, chunk_size=4) as writer:
+            writer.write([True, None, False, None, True])
+        size = os.path.getsize(path)
+
+        for _ in range(3):
+            with TriboolWriter(path) as writer:
+                writer.write([])
+            assert os.path.getsize(path) == size
+
+        assert len(_read_values(path)) == 5
+
+@raises(ValueError)
+def test_log_chunk_size_raises():
+    with _temporary_path() as path:
+        with TriboolWriter(path, chunk_size=4) as writer:
+            writer.write([True])
+        TriboolWriter(path, chunk_size=8)
+
+@raises(ValueError)
+def test_log_slice_raises():
+    with _temporary_path() as path:
+        with TriboolWriter(path) as writer:
+            writer.write([True, False])
+        with TriboolReader(path) as reader:
+            reader[::-1]
+
+def test_window():
+    window = TriboolWindow(3)
+    assert window.all() is Tribool(True)
+    assert window.any() is Tribool(False)
+    assert window.majority() is Tribool(None)
+
+    for value in (True, True, None):
+        window.push(value)
+    assert window.counts() == (2, 0, 1)
+    assert window.all() is Tribool(None)
+    assert window.any() is Tribool(True)
+    assert window.majority() is Tribool(True)
+
+    window.push(False)
+    assert len(window) == 3
+    assert window.counts() == (1, 1, 1)
+    assert window.all() is Tribool(False)
+    assert window.majority() is Tribool(None)
+
+def test_window_scan():
+    values = [True, False, None, None, True, True, True]
+    for reduce in ('all', 'any', 'majority'):
+        results = list(TriboolWindow(3).scan(values, reduce))
+        for index, result in enumerate(results):
+            tail = values[max(0, index - 2):index + 1]
+            window = TriboolWindow(3)
+            for value in tail:
+                window.push(value)
+            assert result is getattr(window, reduce)()
+
+    values = [True, True, None, False]
+    results = [result.value for result in TriboolWindow(2).scan(values)]
+    assert results == [True, True, None, False]
+
+@raises(ValueError)
+def test_window_reduce_raises():
+    list(TriboolWindow(2).scan([True], 'none'))
+
+def test_time_window():
+    window = TriboolTimeWindow(10)
+    window.push(True, 0)
+    window.push(None, 5)
+    assert window.all() is Tribool(None)
+    window.push(True, 10)
+    assert len(window) == 2
+    assert window.all() is Tribool(None)
+    window.expire(15)
+    assert len(window) == 1
+    assert window.all() is Tribool(True)
+
+    pairs = [(0, False), (1, True), (20, True)]
+    results = [result.value for result in TriboolTimeWindow(5).scan(pairs)]
+    assert results == [False, False, True]
+
+def test_time_window_default():
+    clock = tribool._clock
+    times = iter([100.0, 90.0, 200.0])
+    tribool._clock = lambda: next(times)
+    try:
+        window = TriboolTimeWindow(60)
+        window.push(True)
+        window.push(None)
+        assert len(window) == 2
+        assert window.all() is Tribool(None)
+        window.push(False)
+        assert len(window) == 1
+    finally:
+        tribool._clock = clock
+
+@raises(ValueError)
+def test_time_window_order_raises():
+    window = TriboolTimeWindow(10)
+    window.push(True, 5)
+    window.push(True, 4)
+
+def test_filter():
+    items = ['item-%d' % index for index in range(1000)]
+    bloom = TriboolFilter(1000, error_rate=0.01)
+    bloom.update(items)
+    assert bloom.count == 1000
+    assert all(result is Tribool(None) for result in bloom.query(items))
+
+    others = ['other-%d' % index for index in range(1000)]
+    results = bloom.query(others)
+    assert sum(result is Tribool(None) for result in results) < 50
+    assert all(result is not Tribool(True) for result in results)
+
+    bloom.add(b'bytes')
+    bloom.add(12345)
+    assert bloom.contains(b'bytes') is Tribool(None)
+    assert bloom.contains(12345) is Tribool(None)
+
+def test_filter_exact():
+    items = set(range(100))
+    bloom = TriboolFilter(100, exact=items)
+    bloom.update(items)
+    assert all(result is Tribool(True) for result in bloom.query(items))
+    assert all(
+        result is Tribool(False) for result in bloom.query(range(100, 200))
+    )
+
+def test_filter_bytes():
+    bloom = TriboolFilter(100)
+    bloom.update(range(50))
+    copy = TriboolFilter.frombytes(bloom.tobytes())
+    assert copy.size == bloom.size
+    assert copy.hashes == bloom.hashes
+    assert copy.count == 50
+    assert copy.tobytes() == bloom.tobytes()
+    assert all(result is Tribool(None) for result in copy.query(range(50)))
+
+def test_filter_error_rate():
+    for capacity, error_rate in ((10, 1e-2), (100, 1e-3)):
+        bloom = TriboolFilter(capacity, error_rate=error_rate)
+        bloom.update(range(capacity))
+        queries = range(10 ** 9, 10 ** 9 + 50000)
+        results = bloom.query(queries)
+        rate = sum(result is Tribool(None) for result in results) / 50000.0
+        assert rate < 2 * error_rate
+
+@raises(ValueError)
+def test_filter_frombytes_padding_raises():
+    data = bytearray(TriboolFilter(100).tobytes())
+    bloom = TriboolFilter.frombytes(bytes(data))
+    assert bloom.size % 8
+    data[-1] |= 0x80
+    TriboolFilter.frombytes(bytes(data))
+
+@raises(ValueError)
+def test_filter_frombytes_count_raises():
+    bloom = TriboolFilter(100)
+    bloom.add(1)
+    bloom.count = 0
+    TriboolFilter.frombytes(bloom.tobytes())
+
+@raises(ValueError)
+def test_filter_frombytes_raises():
+    TriboolFilter.frombytes(b'invalid')
+
+def test_filter_union():
+    lhs = TriboolFilter(100)
+    rhs = TriboolFilter(100)
+    lhs.update(range(50))
+    rhs.update(range(50, 100))
+    union = lhs | rhs
+    assert union.count == 100
+    assert all(result is Tribool(None) for result in union.query(range(100)))
+
+@raises(ValueError)
+def test_filter_union_raises():
+    TriboolFilter(100) | TriboolFilter(1000)
+
+@raises(TypeError)
+def test_filter_item_raises():
+    TriboolFilter(100).add(1.5)
+
+def _random_rules(attributes, count, size):
+    rules = []
+    for _ in range(count):
+        keys = random.sample(attributes, random.randint(0, size))
+        rules.append(dict(
+            (key, random.choice([True, False, None])) for key in keys
+        ))
+    return rules
+
+def _brute_match(rules, record):
+    return frozenset(
+        index for index, rule in enumerate(rules)
+        if all(record.get(key) is value for key, value in rule.items())
+    )
+
+def test_rules():
+    rules = TriboolRules([
+        {'ready': True, 'committed': None},
+        {'ready': 'True'},
+        {'committed': False},
+        {},
+    ])
+    assert len(rules) == 4
+    assert rules.match({'ready': Tribool(True)}) == frozenset([0, 1, 3])
+    assert rules.match({'ready': False, 'committed': False}) == {2, 3}
+    assert rules.add({'ready': None}) == 4
+    assert rules.match({}) == {3, 4}
+
+def test_rules_random():
+    random.seed(0)
+    attributes = list('abcdefgh')
+    rules = _random_rules(attributes, 100, 6)
+    records = _random_rules(attributes, 200, 8)
+    matcher = TriboolRules(rules)
+    for record in records:
+        assert matcher.match(record) == _brute_match(rules, record)
+
+def test_rules_many():
+    random.seed(0)
+    attributes = ['a%d' % index for index in range(100)]
+    rules = _random_rules(attributes, 5000, 5)
+    records = _random_rules(attributes, 20, 100)
+    records.extend(rules[:20])
+    matcher = TriboolRules(rules)
+    assert len(matcher) == 5000
+    for record in records:
+        assert matcher.match(record) == _brute_match(rules, record)
+    columns = dict(
+        (key, TriboolArray([record.get(key) for record in records]))
+        for key in attributes
+    )
+    results = matcher.match_columns(columns)
+    assert results == [_brute_match(rules, record) for record in records]
+
+def test_rules_columns():
+    random.seed(0)
+    attributes = list('abcdef')
+    rules = _random_rules(attributes, 50, 4)
+    records = _random_rules(attributes, 100, 6)
+    matcher = TriboolRules(rules)
+    columns = dict(
+        (key, TriboolArray([record.get(key) for record in records]))
+        for key in attributes[:-1]
+    )
+    columns['f'] = [record.get('f') for record in records]
+    results = matcher.match_columns(columns)
+    assert results == [_brute_match(rules, record) for record in records]
+    assert matcher.match_columns({}) == []
+    assert matcher.match_columns({'a': []}) == []
+
+@raises(ValueError)
+def test_rules_columns_raises():
+    TriboolRules([{'a': True}]).match_columns({'a': [True], 'b': []})
+
+@raises(ValueError)
+def test_rules_add_raises():
+    TriboolRules().add({'a': 0})
+
 if __name__ == '__main__':
     nose.run()
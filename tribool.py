@@ -1,5 +1,18 @@
 "Tribool: three-valued logic data type."
 
+import hashlib
+import math
+import os
+import re
+import struct
+import time
+import zlib
+
+from binascii import hexlify, unhexlify
+from collections import deque
+from itertools import chain, islice
+
+
 class Tribool(tuple):
     """Implementation of three-valued logic.
 
@@ -53,6 +66,102 @@ class Tribool(tuple):
         else:
             raise ValueError('Unsupported value: %r' % that)
 
+    @classmethod
+    def _resolve_strict(cls, that):
+        """Resolve `that` to one of True, False, or None without names.
+
+        Raises ValueError if `that` is unsupported.
+
+        """
+        if that is True or that is False or that is None:
+            return that
+        elif isinstance(that, cls):
+            return that.value
+        else:
+            raise ValueError('Unsupported value: %r' % (that,))
+
+    @classmethod
+    def _resolver(cls, coerce):
+        """Return function resolving values according to `coerce` policy.
+
+        See `Tribool.convert` for a description of policies.
+
+        """
+        if coerce == 'strict':
+            return cls._resolve_strict
+        elif coerce == 'names':
+            mapping = cls._names
+        elif hasattr(coerce, 'items'):
+            mapping = coerce
+        else:
+            raise ValueError('Unsupported coercion: %r' % (coerce,))
+
+        mapping = dict(
+            (key, cls._resolve(value)) for key, value in mapping.items()
+        )
+        resolve_strict = cls._resolve_strict
+
+        def resolve(that):
+            try:
+                return resolve_strict(that)
+            except ValueError:
+                pass
+
+            try:
+                return mapping[that]
+            except (KeyError, TypeError):
+                raise ValueError('Unsupported value: %r' % (that,))
+
+        return resolve
+
+    @classmethod
+    def _convert(cls, values, coerce, outputs):
+        """Return list of `outputs` for each of `values`.
+
+        `outputs` maps True, False, and None to a result. Each distinct input
+        value (by type and equality) is resolved only once.
+
+        """
+        resolve = cls._resolver(coerce)
+        memo = {}
+        result = []
+        append = result.append
+
+        for value in values:
+            try:
+                key = (type(value), value)
+                append(memo[key])
+            except KeyError:
+                output = memo[key] = outputs[resolve(value)]
+                append(output)
+            except TypeError:
+                append(outputs[resolve(value)])
+
+        return result
+
+    @classmethod
+    def convert(cls, values, coerce='names', packed=False):
+        """Convert iterable of `values` to Tribool values in bulk.
+
+        `coerce` is the policy for resolving each value:
+
+        * 'strict' accepts only True, False, None, or Tribool.
+        * 'names' additionally accepts names like those given to `Tribool`.
+        * A mapping accepts True, False, None, or Tribool and otherwise looks
+          up the value in the mapping, e.g. ``{1: True, 0: False, 'yes':
+          True, 'no': False}``.
+
+        Returns a list of Tribool singletons or a `TriboolArray` when `packed`
+        is true. Each distinct input value is resolved only once so large
+        inputs with few distinct values convert quickly.
+
+        Raises ValueError if a value or `coerce` is unsupported.
+
+        """
+        if packed:
+            return TriboolArray(values, coerce)
+        return cls._convert(values, coerce, _singletons)
+
     @property
     def value(self):
         "Shortcut for internal and immutable True, False or None value."
@@ -225,6 +334,1161 @@ class Tribool(tuple):
     }
 
 
+_singletons = dict((value, Tribool(value)) for value in (True, False, None))
+
+
+class TriboolArray(object):
+    """Compact sequence of Tribool values.
+
+    Values are packed four to a byte as two-bit codes: 0 for False, 1 for True
+    and 2 for Indeterminate. Indexing and iteration return Tribool singletons.
+
+    """
+    _codes = {False: 0, True: 1, None: 2}
+    _values = (False, True, None)
+
+    def __init__(self, values=(), coerce='names'):
+        """Create TriboolArray from iterable of `values`.
+
+        `coerce` is the policy for resolving values as in `Tribool.convert`.
+
+        """
+        self._data = bytearray()
+        self._len = 0
+        self.extend(values, coerce)
+
+    @classmethod
+    def frombytes(cls, data, length):
+        """Create TriboolArray of `length` values from packed `data`.
+
+        Raises ValueError if `data` is not a valid packing of `length` values.
+
+        """
+        data = bytearray(data)
+
+        if length < 0 or len(data) != (length + 3) // 4:
+            raise ValueError('Invalid length: %r' % length)
+        if bytes(data).translate(None, _valid_bytes):
+            raise ValueError('Invalid code in data')
+
+        if length % 4:
+            data[-1] &= (1 << ((length % 4) << 1)) - 1
+
+        result = cls()
+        result._data = data
+        result._len = length
+        return result
+
+    @classmethod
+    def fromcodes(cls, codes):
+        """Create TriboolArray from `codes`, one code per byte.
+
+        Raises ValueError if `codes` contains an invalid code.
+
+        """
+        codes = bytes(bytearray(codes))
+        if codes.translate(None, _code_bytes):
+            raise ValueError('Invalid code in codes')
+        result = cls()
+        result._data = _pack(codes)
+        result._len = len(codes)
+        return result
+
+    def tobytes(self):
+        "Return packed bytes of values, four to a byte."
+        return bytes(self._data)
+
+    def codes(self):
+        "Return bytes of value codes, one code per byte."
+        codes = b''.join(map(_unpack_codes.__getitem__, self._data))
+        return codes[:self._len]
+
+    def append(self, value, coerce='names'):
+        """Append `value` to array.
+
+        `coerce` is the policy for resolving `value` as in `Tribool.convert`.
+
+        """
+        code = self._codes[Tribool._resolver(coerce)(value)]
+        shift = (self._len & 3) << 1
+        if shift:
+            self._data[-1] |= code << shift
+        else:
+            self._data.append(code)
+        self._len += 1
+
+    def extend(self, values, coerce='names'):
+        """Extend array by iterable of `values`.
+
+        `coerce` is the policy for resolving values as in `Tribool.convert`.
+
+        """
+        codes = bytes(bytearray(Tribool._convert(values, coerce, self._codes)))
+        if not codes:
+            return
+        tail = self._len & 3
+        if tail:
+            codes = _unpack_codes[self._data.pop()][:tail] + codes
+        self._data.extend(_pack(codes))
+        self._len += len(codes) - tail
+
+    def __len__(self):
+        "Number of values in array."
+        return self._len
+
+    def __getitem__(self, index):
+        "Tribool at `index` or TriboolArray for slice `index`."
+        if isinstance(index, slice):
+            return TriboolArray.fromcodes(self.codes()[index])
+
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('TriboolArray index out of range')
+
+        code = (self._data[index >> 2] >> ((index & 3) << 1)) & 3
+        return _singletons[self._values[code]]
+
+    def __iter__(self):
+        "Iterate Tribool singletons in array."
+        values = chain.from_iterable(map(_unpack.__getitem__, self._data))
+        return islice(values, self._len)
+
+    def __repr__(self):
+        "String representation of TriboolArray."
+        values = ', '.join(repr(value.value) for value in self)
+        return '%s([%s])' % (self.__class__.__name__, values)
+
+
+def _pack(codes):
+    "Pack bytes of `codes` four to a byte."
+    codes += b'\x00' * (-len(codes) % 4)
+    groups = (codes[index:index + 4] for index in range(0, len(codes), 4))
+    return bytearray(map(_pack_codes.__getitem__, groups))
+
+
+_unpack_codes = {}
+_unpack = {}
+_pack_codes = {}
+
+for _byte in range(256):
+    _group = [(_byte >> _shift) & 3 for _shift in (0, 2, 4, 6)]
+    _unpack_codes[_byte] = bytes(bytearray(_group))
+    if 3 not in _group:
+        _pack_codes[_unpack_codes[_byte]] = _byte
+        _unpack[_byte] = tuple(
+            _singletons[TriboolArray._values[_code]] for _code in _group
+        )
+
+_valid_bytes = bytes(bytearray(sorted(_unpack)))
+_code_bytes = bytes(bytearray(range(3)))
+
+del _byte, _group
+
+
+class TriboolWriter(object):
+    """Append Tribool values to a chunked log file.
+
+    Values are stored in chunks of `chunk_size` values. Each chunk is written
+    as one or more segments, each encoded packed (four values to a byte) or
+    run-length, whichever is smaller. Footers index the segments of each
+    chunk so `TriboolReader` can seek to any position in constant time.
+
+    Opening an existing log appends to it. Existing bytes are never modified:
+    new segments and footers are written past the end of the file and each
+    footer links to the previous one. If a write is interrupted, the log is
+    recovered from its last complete footer.
+
+    Call `flush` to write and index all values written so far. Each flush
+    writes only the values added since the previous flush as a tail segment.
+    A chunk completed from several segments is rewritten once as a single
+    segment so every value is encoded at most twice.
+
+    Most footers index only the segments written since the previous footer.
+    A checkpoint footer indexing every segment is written once the footers
+    since the last checkpoint hold as many entries as the index, so opening a
+    log reads index entries proportional to the size of the index.
+
+    """
+    def __init__(self, path, chunk_size=None):
+        """Open log at `path` for appending, creating it if necessary.
+
+        `chunk_size` defaults to 65536 for new logs and to the stored chunk
+        size for existing logs.
+
+        Raises ValueError if `chunk_size` does not match an existing log.
+
+        """
+        self._buffer = bytearray()
+        self._flushed = 0
+        self._entries = []
+
+        if os.path.exists(path) and os.path.getsize(path):
+            self._file = open(path, 'r+b')
+            try:
+                stored, length, index, self._footer, self._chain = _read_log(
+                    self._file
+                )
+                if chunk_size is not None and chunk_size != stored:
+                    raise ValueError('Mismatched chunk size: %r' % chunk_size)
+                self.chunk_size = stored
+                self._index = index
+                self._size = sum(len(segments) for segments in index)
+                self._length = length - length % stored
+                if length % stored:
+                    chunk = _read_segments(self._file, index[-1],
+                                           length % stored)
+                    self._buffer.extend(chunk.codes())
+                    self._flushed = len(self._buffer)
+            except Exception:
+                self._file.close()
+                raise
+            self._file.seek(0, 2)
+        else:
+            if chunk_size is None:
+                chunk_size = 65536
+            if chunk_size < 1:
+                raise ValueError('Invalid chunk size: %r' % chunk_size)
+            self._file = open(path, 'wb')
+            self._file.write(_LOG_HEADER.pack(_LOG_MAGIC, chunk_size))
+            self.chunk_size = chunk_size
+            self._index = []
+            self._size = 0
+            self._footer = None
+            self._chain = 0
+            self._length = 0
+
+    def write(self, values, coerce='names'):
+        """Append iterable of `values` to log.
+
+        `values` may be a TriboolArray or any iterable of values resolved
+        according to `coerce` as in `Tribool.convert`.
+
+        """
+        if isinstance(values, TriboolArray):
+            codes = values.codes()
+        else:
+            codes = Tribool._convert(values, coerce, TriboolArray._codes)
+
+        buffer = self._buffer
+        buffer.extend(codes)
+        chunk_size = self.chunk_size
+
+        if len(buffer) >= chunk_size:
+            count = len(buffer) - len(buffer) % chunk_size
+            for start in range(0, count, chunk_size):
+                self._write_segment(bytes(buffer[start:start + chunk_size]), 0)
+                self._length += chunk_size
+                self._flushed = 0
+            del buffer[:count]
+
+    def append(self, value, coerce='names'):
+        """Append `value` to log.
+
+        `coerce` is the policy for resolving `value` as in `Tribool.convert`.
+
+        """
+        self.write((value,), coerce)
+
+    def __len__(self):
+        "Number of values in log including buffered values."
+        return self._length + len(self._buffer)
+
+    def _write_segment(self, codes, start):
+        "Write segment of `codes` at `start` of the current chunk."
+        number = self._length // self.chunk_size
+        offset = self._file.tell()
+        kind, payload = _encode_chunk(codes)
+        self._file.write(_CHUNK_HEADER.pack(kind, len(codes), len(payload)))
+        self._file.write(payload)
+        self._entries.append((number, start, offset))
+        if start == 0 and number < len(self._index):
+            self._size -= len(self._index[number])
+        self._size += 1
+        _index_segment(self._index, number, start, offset)
+
+    def flush(self):
+        """Write values added since the last flush and a footer indexing them.
+
+        Does nothing if no values were written since the last footer.
+
+        """
+        if len(self._buffer) > self._flushed:
+            codes = bytes(self._buffer[self._flushed:])
+            self._write_segment(codes, self._flushed)
+            self._flushed = len(self._buffer)
+
+        if not self._entries and self._footer is not None:
+            return
+
+        if self._footer is None or self._chain >= max(64, self._size):
+            kind = _INDEX_CHECKPOINT
+            entries = [
+                (number, start, offset)
+                for number, segments in enumerate(self._index)
+                for start, offset in segments
+            ]
+            self._chain = 0
+        else:
+            kind = _INDEX_UPDATE
+            entries = self._entries
+            self._chain += len(entries)
+
+        data = b''.join(_INDEX_ENTRY.pack(*entry) for entry in entries)
+        fields = (self._footer or 0, len(entries), len(self), kind)
+        crc = zlib.crc32(data + _INDEX_FIELDS.pack(*fields)) & 0xffffffff
+        self._file.write(data)
+        self._file.write(_INDEX_TRAILER.pack(*(fields + (crc, _INDEX_MAGIC))))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self._footer = self._file.tell()
+        self._entries = []
+
+    def close(self):
+        "Flush buffered values and footer, then close log."
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        "Return writer for use in `with` statement."
+        return self
+
+    def __exit__(self, *exc_info):
+        "Close writer at end of `with` statement."
+        self.close()
+
+
+class TriboolReader(object):
+    """Read Tribool values from a log written by `TriboolWriter`.
+
+    The index is loaded when the log is opened so values written later are
+    not visible. Opening reads footers back to the last checkpoint which
+    takes time proportional to the size of the index. Values and chunks are
+    then decoded lazily and seeking takes constant time.
+
+    """
+    def __init__(self, path):
+        "Open log at `path` for reading."
+        self._file = open(path, 'rb')
+        try:
+            self.chunk_size, self._length, self._index, _, _ = _read_log(
+                self._file
+            )
+        except Exception:
+            self._file.close()
+            raise
+        self._cache = (None, None)
+
+    def __len__(self):
+        "Number of values in log."
+        return self._length
+
+    def _read(self, number):
+        "Return TriboolArray of values in chunk `number`."
+        count = min(self.chunk_size, self._length - number * self.chunk_size)
+        return _read_segments(self._file, self._index[number], count)
+
+    def chunk(self, number):
+        "Return TriboolArray of values in chunk `number`."
+        if self._cache[0] != number:
+            self._cache = (number, self._read(number))
+        return self._cache[1]
+
+    def chunks(self, start=0, stop=None):
+        "Iterate TriboolArray chunks from chunk `start` up to `stop`."
+        start, stop, _ = slice(start, stop).indices(len(self._index))
+        for number in range(start, stop):
+            yield self._read(number)
+
+    def __getitem__(self, index):
+        """Tribool at `index` or TriboolArray for slice `index` in log.
+
+        Raises ValueError if a slice step is not positive.
+
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step < 1:
+                raise ValueError('Slice step must be positive')
+            return TriboolArray(islice(self.read(start, stop), 0, None, step))
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('TriboolReader index out of range')
+        number, position = divmod(index, self.chunk_size)
+        return self.chunk(number)[position]
+
+    def read(self, start=0, stop=None):
+        "Iterate Tribool values from index `start` up to `stop`."
+        start, stop, _ = slice(start, stop).indices(self._length)
+        chunk_size = self.chunk_size
+        while start < stop:
+            number, position = divmod(start, chunk_size)
+            count = min(chunk_size - position, stop - start)
+            chunk = self.chunk(number)
+            for value in islice(chunk, position, position + count):
+                yield value
+            start += count
+
+    def __iter__(self):
+        "Iterate Tribool values in log."
+        return self.read()
+
+    def close(self):
+        "Close log."
+        self._file.close()
+
+    def __enter__(self):
+        "Return reader for use in `with` statement."
+        return self
+
+    def __exit__(self, *exc_info):
+        "Close reader at end of `with` statement."
+        self.close()
+
+
+_LOG_MAGIC = b'TRILOG02'
+_LOG_HEADER = struct.Struct('<8sI')
+_CHUNK_HEADER = struct.Struct('<BII')
+_CHUNK_PACKED = 0
+_CHUNK_RUNS = 1
+_INDEX_MAGIC = b'TRIIDX02'
+_INDEX_UPDATE = 0
+_INDEX_CHECKPOINT = 1
+_INDEX_ENTRY = struct.Struct('<QIQ')
+_INDEX_FIELDS = struct.Struct('<QQQI')
+_INDEX_TRAILER = struct.Struct('<QQQII8s')
+_runs = re.compile(b'\x00+|\x01+|\x02+')
+
+
+def _encode_chunk(codes):
+    "Return kind and payload of smallest encoding of `codes`."
+    budget = (len(codes) + 3) // 4
+
+    # Count runs without a Python-level loop by comparing `codes` with itself
+    # shifted by one as big integers. Each run needs at least two bytes.
+
+    if len(codes) > 1:
+        head = int(hexlify(codes[:-1]), 16)
+        tail = int(hexlify(codes[1:]), 16)
+        changes = unhexlify('%0*x' % (2 * (len(codes) - 1), head ^ tail))
+        runs = len(changes) - changes.count(b'\x00') + 1
+        if 2 * runs >= budget:
+            return _CHUNK_PACKED, bytes(_pack(codes))
+
+    payload = bytearray()
+
+    for match in _runs.finditer(codes):
+        start, end = match.span()
+        payload += codes[start:start + 1]
+        run = end - start
+        while run > 0x7f:
+            payload.append(run & 0x7f | 0x80)
+            run >>= 7
+        payload.append(run)
+        if len(payload) >= budget:
+            return _CHUNK_PACKED, bytes(_pack(codes))
+
+    return _CHUNK_RUNS, bytes(payload)
+
+
+def _decode_runs(payload):
+    "Return codes from run-length encoded `payload`."
+    payload = bytearray(payload)
+    parts = []
+    index = 0
+
+    while index < len(payload):
+        code = payload[index]
+        run = shift = 0
+        while True:
+            index += 1
+            byte = payload[index]
+            run |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        parts.append(_code_bytes[code:code + 1] * run)
+        index += 1
+
+    return b''.join(parts)
+
+
+def _read_segment(file, offset):
+    """Return TriboolArray of segment at `offset` in `file`.
+
+    Raises ValueError if the segment is invalid.
+
+    """
+    file.seek(offset)
+    header = file.read(_CHUNK_HEADER.size)
+    if len(header) != _CHUNK_HEADER.size:
+        raise ValueError('Truncated segment at %r' % offset)
+    kind, count, size = _CHUNK_HEADER.unpack(header)
+    payload = file.read(size)
+    if len(payload) != size:
+        raise ValueError('Truncated segment at %r' % offset)
+
+    if kind == _CHUNK_PACKED:
+        return TriboolArray.frombytes(payload, count)
+    elif kind == _CHUNK_RUNS:
+        try:
+            codes = _decode_runs(payload)
+        except IndexError:
+            raise ValueError('Invalid segment at %r' % offset)
+        if len(codes) != count:
+            raise ValueError('Invalid segment at %r' % offset)
+        return TriboolArray.fromcodes(codes)
+    else:
+        raise ValueError('Invalid segment at %r' % offset)
+
+
+def _index_segment(index, number, start, offset):
+    """Record segment at `offset` for `start` of chunk `number` in `index`.
+
+    A segment at the start of a chunk replaces earlier segments of the chunk.
+
+    Raises ValueError if chunk `number` is beyond the end of `index`.
+
+    """
+    if number == len(index):
+        index.append([])
+    elif number > len(index):
+        raise ValueError('Invalid tribool log index')
+    if start == 0:
+        index[number] = [(start, offset)]
+    else:
+        index[number].append((start, offset))
+
+
+def _read_segments(file, segments, count):
+    """Return TriboolArray of `count` values in `segments` of `file`.
+
+    Raises ValueError if the segments are invalid.
+
+    """
+    parts = []
+    total = 0
+    for start, offset in segments:
+        if start != total:
+            raise ValueError('Invalid segment at %r' % offset)
+        part = _read_segment(file, offset)
+        parts.append(part)
+        total += len(part)
+        if total >= count:
+            break
+    if total < count:
+        raise ValueError('Incomplete tribool log chunk')
+    if len(parts) == 1 and total == count:
+        return parts[0]
+    codes = b''.join(part.codes() for part in parts)
+    return TriboolArray.fromcodes(codes[:count])
+
+
+def _read_footer(file, end):
+    """Return footer ending at `end` in `file` or None if invalid.
+
+    The footer is a tuple of (previous footer end, total length, kind,
+    entries) where entries are tuples of (chunk number, start, offset).
+
+    """
+    start = end - _INDEX_TRAILER.size
+    if start < _LOG_HEADER.size:
+        return None
+    file.seek(start)
+    trailer = file.read(_INDEX_TRAILER.size)
+    if len(trailer) != _INDEX_TRAILER.size:
+        return None
+    prev, count, length, kind, crc, magic = _INDEX_TRAILER.unpack(trailer)
+    size = count * _INDEX_ENTRY.size
+    if magic != _INDEX_MAGIC or start - size < _LOG_HEADER.size:
+        return None
+    file.seek(start - size)
+    data = file.read(size)
+    fields = _INDEX_FIELDS.pack(prev, count, length, kind)
+    if zlib.crc32(data + fields) & 0xffffffff != crc:
+        return None
+    entries = [
+        _INDEX_ENTRY.unpack_from(data, position)
+        for position in range(0, size, _INDEX_ENTRY.size)
+    ]
+    return prev, length, kind, entries
+
+
+def _find_footer(file, end):
+    "Return end of last valid footer in `file` before `end` or None."
+    width = len(_INDEX_MAGIC)
+    stop = end
+    while stop > _LOG_HEADER.size:
+        start = max(_LOG_HEADER.size, stop - (1 << 16))
+        file.seek(start)
+        block = file.read(min(stop + width - 1, end) - start)
+        position = block.rfind(_INDEX_MAGIC)
+        while position != -1:
+            if _read_footer(file, start + position + width) is not None:
+                return start + position + width
+            position = block.rfind(_INDEX_MAGIC, 0, position + width - 1)
+        stop = start
+    return None
+
+
+def _read_log(file):
+    """Return chunk size, length, index, footer end and chain of log `file`.
+
+    The index lists the (start, offset) segments of each chunk. The chain is
+    the number of index entries in footers after the last checkpoint.
+
+    Raises ValueError if `file` is not a valid log.
+
+    """
+    file.seek(0)
+    header = file.read(_LOG_HEADER.size)
+    if len(header) != _LOG_HEADER.size:
+        raise ValueError('Invalid tribool log')
+    magic, chunk_size = _LOG_HEADER.unpack(header)
+    if magic != _LOG_MAGIC or chunk_size < 1:
+        raise ValueError('Invalid tribool log')
+
+    file.seek(0, 2)
+    end = file.tell()
+    if _read_footer(file, end) is None:
+        end = _find_footer(file, end)
+        if end is None:
+            raise ValueError('Missing tribool log index')
+
+    footers = []
+    position = end
+
+    while True:
+        footer = _read_footer(file, position)
+        if footer is None:
+            raise ValueError('Invalid tribool log index at %r' % position)
+        footers.append(footer)
+        prev, _, kind, _ = footer
+        if kind == _INDEX_CHECKPOINT:
+            break
+        if not prev:
+            raise ValueError('Missing tribool log checkpoint')
+        position = prev
+
+    index = []
+    for _, _, _, entries in reversed(footers):
+        for number, start, offset in entries:
+            _index_segment(index, number, start, offset)
+
+    length = footers[0][1]
+    chunks = -(-length // chunk_size)
+    if len(index) < chunks:
+        raise ValueError('Incomplete tribool log index')
+    del index[chunks:]
+
+    chain = sum(len(entries) for _, _, _, entries in footers[:-1])
+    return chunk_size, length, index, end, chain
+
+
+class _TriboolWindow(object):
+    """Running counts of True, False and Indeterminate values in a window.
+
+    Subclasses add values with `_add` and evict the oldest with `_evict`.
+
+    """
+    _reducers = ('all', 'any', 'majority')
+
+    def __init__(self):
+        "Create empty window."
+        self._items = deque()
+        self._counts = [0, 0, 0]
+
+    def _add(self, item, code):
+        "Add `item` with value `code` to window."
+        self._items.append(item)
+        self._counts[code] += 1
+
+    def _evict(self):
+        "Evict oldest item from window."
+        self._counts[self._code(self._items.popleft())] -= 1
+
+    def __len__(self):
+        "Number of values in window."
+        return len(self._items)
+
+    def counts(self):
+        "Return tuple of True, False and Indeterminate counts in window."
+        falses, trues, nones = self._counts
+        return trues, falses, nones
+
+    def all(self):
+        """Kleene `and` of values in window.
+
+        False if any value is False, else Indeterminate if any value is
+        Indeterminate, else True (including for an empty window).
+
+        """
+        falses, _, nones = self._counts
+        return _singletons[False if falses else None if nones else True]
+
+    def any(self):
+        """Kleene `or` of values in window.
+
+        True if any value is True, else Indeterminate if any value is
+        Indeterminate, else False (including for an empty window).
+
+        """
+        _, trues, nones = self._counts
+        return _singletons[True if trues else None if nones else False]
+
+    def majority(self):
+        """Kleene majority of values in window.
+
+        True if more than half the values are True, False if more than half
+        the values are False, else Indeterminate.
+
+        """
+        falses, trues, _ = self._counts
+        half = len(self._items) / 2.0
+        if trues > half:
+            return _singletons[True]
+        elif falses > half:
+            return _singletons[False]
+        else:
+            return _singletons[None]
+
+    def _reducer(self, reduce):
+        "Return reducer method named `reduce`."
+        if reduce not in self._reducers:
+            raise ValueError('Unsupported reducer: %r' % (reduce,))
+        return getattr(self, reduce)
+
+
+class TriboolWindow(_TriboolWindow):
+    """Sliding window over the last `size` Tribool values.
+
+    Running counts give constant time updates and Kleene `all`, `any` and
+    `majority` reductions returning Tribool singletons.
+
+    """
+    def __init__(self, size):
+        """Create window over the last `size` values.
+
+        Raises ValueError if `size` is less than one.
+
+        """
+        if size < 1:
+            raise ValueError('Invalid window size: %r' % size)
+        super(TriboolWindow, self).__init__()
+        self.size = size
+
+    def _code(self, item):
+        "Return value code of window `item`."
+        return item
+
+    def push(self, value):
+        """Add `value`, resolved like `Tribool(value)`, to window.
+
+        Evicts the oldest value when the window is full.
+
+        """
+        code = TriboolArray._codes[Tribool._resolve(value)]
+        self._add(code, code)
+        if len(self._items) > self.size:
+            self._evict()
+
+    def scan(self, values, reduce='all'):
+        """Push each of `values` and yield reduction of window after each.
+
+        `reduce` is one of 'all', 'any' or 'majority'.
+
+        """
+        reducer = self._reducer(reduce)
+        for value in values:
+            self.push(value)
+            yield reducer()
+
+
+class TriboolTimeWindow(_TriboolWindow):
+    """Sliding window over Tribool values from the last `duration` seconds.
+
+    Values are pushed with nondecreasing timestamps. A value expires once its
+    timestamp is `duration` or more before the latest timestamp. Running counts
+    give amortized constant time updates and Kleene `all`, `any` and
+    `majority` reductions returning Tribool singletons.
+
+    """
+    def __init__(self, duration):
+        """Create window over the last `duration` seconds.
+
+        Raises ValueError if `duration` is not positive.
+
+        """
+        if duration <= 0:
+            raise ValueError('Invalid window duration: %r' % duration)
+        super(TriboolTimeWindow, self).__init__()
+        self.duration = duration
+        self._latest = None
+
+    def _code(self, item):
+        "Return value code of window `item`."
+        return item[1]
+
+    def expire(self, timestamp):
+        """Evict values that expired by `timestamp`.
+
+        Raises ValueError if `timestamp` is before the latest timestamp.
+
+        """
+        if self._latest is not None and timestamp < self._latest:
+            raise ValueError('Timestamp out of order: %r' % timestamp)
+        self._latest = timestamp
+        items = self._items
+        cutoff = timestamp - self.duration
+        while items and items[0][0] <= cutoff:
+            self._evict()
+
+    def push(self, value, timestamp=None):
+        """Add `value`, resolved like `Tribool(value)`, at `timestamp`.
+
+        `timestamp` defaults to a monotonic clock (`time.monotonic` where
+        available, else `time.time`) clamped to the latest timestamp so clock
+        adjustments never make a default push fail. Do not mix default and
+        explicit timestamps. Evicts expired values.
+
+        Raises ValueError if `timestamp` is before the latest timestamp.
+
+        """
+        if timestamp is None:
+            timestamp = _clock()
+            if self._latest is not None and timestamp < self._latest:
+                timestamp = self._latest
+        code = TriboolArray._codes[Tribool._resolve(value)]
+        self.expire(timestamp)
+        self._add((timestamp, code), code)
+
+    def scan(self, pairs, reduce='all'):
+        """Push each (timestamp, value) of `pairs` and yield reductions.
+
+        `reduce` is one of 'all', 'any' or 'majority'.
+
+        """
+        reducer = self._reducer(reduce)
+        for timestamp, value in pairs:
+            self.push(value, timestamp)
+            yield reducer()
+
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class TriboolFilter(object):
+    """Bloom filter answering membership with Tribool values.
+
+    `contains` returns Tribool(False) when an item is definitely absent and
+    Tribool(None) when it is possibly present. An optional `exact` tier is
+    consulted for possibly present items and its answer, resolved like
+    `Tribool(...)`, is returned instead. `exact` may be a callable like
+    `set.__contains__` or a container supporting `in`.
+
+    Items may be bytes, text or integers.
+
+    """
+    _magic = b'TRIBLM01'
+    _header = struct.Struct('<8sQQQ')
+
+    def __init__(self, capacity, error_rate=0.01, exact=None):
+        """Create filter for `capacity` items with false positive `error_rate`.
+
+        Raises ValueError if `capacity` or `error_rate` is out of range.
+
+        """
+        if capacity < 1:
+            raise ValueError('Invalid capacity: %r' % capacity)
+        if not 0 < error_rate < 1:
+            raise ValueError('Invalid error rate: %r' % error_rate)
+        size = int(math.ceil(-capacity * math.log(error_rate)
+                             / (math.log(2) ** 2)))
+        hashes = max(1, int(round(size / float(capacity) * math.log(2))))
+        self._init(size, hashes, 0, bytearray((size + 7) // 8), exact)
+
+    def _init(self, size, hashes, count, bits, exact):
+        "Initialize filter state."
+        self.size = size
+        self.hashes = hashes
+        self.count = count
+        self._bits = bits
+        if exact is None or callable(exact):
+            self.exact = exact
+        else:
+            self.exact = exact.__contains__
+
+    def _indexes(self, item):
+        "Return bit indexes of `item`."
+        if isinstance(item, bytes):
+            key = item
+        elif isinstance(item, type(u'')):
+            key = item.encode('utf-8')
+        elif isinstance(item, (int, type(2 ** 64))):
+            key = ('%d' % item).encode('ascii')
+        else:
+            raise TypeError('Unsupported item: %r' % (item,))
+        hashes = self.hashes
+        digest = b''.join(
+            hashlib.sha512(struct.pack('<I', block) + key).digest()
+            for block in range((hashes + 7) // 8)
+        )
+        size = self.size
+        values = struct.unpack('<%dQ' % hashes, digest[:8 * hashes])
+        return [value % size for value in values]
+
+    def add(self, item):
+        "Add `item` to filter."
+        bits = self._bits
+        for index in self._indexes(item):
+            bits[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def update(self, items):
+        "Add each of `items` to filter."
+        for item in items:
+            self.add(item)
+
+    def contains(self, item):
+        """Return Tribool for membership of `item`.
+
+        False if `item` is definitely absent, else the answer of the `exact`
+        tier if attached, else Indeterminate.
+
+        """
+        bits = self._bits
+        for index in self._indexes(item):
+            if not bits[index >> 3] & (1 << (index & 7)):
+                return _singletons[False]
+        if self.exact is None:
+            return _singletons[None]
+        return Tribool(self.exact(item))
+
+    def query(self, items):
+        "Return list of Tribool memberships for each of `items`."
+        return [self.contains(item) for item in items]
+
+    def tobytes(self):
+        "Return serialized filter. The `exact` tier is not included."
+        header = self._header.pack(self._magic, self.size, self.hashes,
+                                   self.count)
+        return header + bytes(self._bits)
+
+    @classmethod
+    def frombytes(cls, data, exact=None):
+        """Create filter from serialized `data` with optional `exact` tier.
+
+        Raises ValueError if `data` is invalid.
+
+        """
+        size = cls._header.size
+        if len(data) < size:
+            raise ValueError('Invalid filter data')
+        magic, bits, hashes, count = cls._header.unpack(data[:size])
+        if magic != cls._magic or len(data) - size != (bits + 7) // 8:
+            raise ValueError('Invalid filter data')
+        if bits < 1 or hashes < 1:
+            raise ValueError('Invalid filter data')
+        array = bytearray(data[size:])
+        if bits % 8 and array[-1] >> (bits % 8):
+            raise ValueError('Invalid filter padding')
+        if not count and any(array):
+            raise ValueError('Invalid filter count')
+        result = cls.__new__(cls)
+        result._init(bits, hashes, count, array, exact)
+        return result
+
+    def __or__(self, that):
+        """Union of filters with matching size and hashes.
+
+        The result has no `exact` tier.
+
+        Raises ValueError if the filters are incompatible.
+
+        """
+        if not isinstance(that, TriboolFilter):
+            return NotImplemented
+        if (self.size, self.hashes) != (that.size, that.hashes):
+            raise ValueError('Incompatible filters')
+        digits = 2 * len(self._bits)
+        union = (int(hexlify(bytes(self._bits)), 16)
+                 | int(hexlify(bytes(that._bits)), 16))
+        bits = bytearray(unhexlify('%0*x' % (digits, union)))
+        result = self.__class__.__new__(self.__class__)
+        result._init(self.size, self.hashes, self.count + that.count, bits,
+                     None)
+        return result
+
+
+class TriboolRules(object):
+    """Match records against many rules using per-attribute index sets.
+
+    A rule maps attributes to required values, True, False or Indeterminate,
+    resolved like `Tribool(...)`. A record maps attributes to Tribool values;
+    missing attributes are Indeterminate. A rule matches a record when every
+    required attribute of the record has the required value.
+
+    Each attribute has a branch per Tribool value holding the set of rules,
+    as an integer bitset, that the value rules out. Matching a record unions
+    one set per attribute so the number of Python-level steps is proportional
+    to the number of attributes rather than the number of rules. Each step is
+    a bitwise operation on an integer with one bit per rule. Storage grows
+    with the total size of the rules and never blows up.
+
+    """
+    def __init__(self, rules=()):
+        "Create rule set from iterable of `rules`."
+        self.attributes = []
+        self._conflicts = {}
+        self._rules = []
+        self._all = 0
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        "Number of rules."
+        return len(self._rules)
+
+    def add(self, rule):
+        """Add `rule` mapping attributes to required values.
+
+        Returns the integer id of the rule, numbered from zero in order of
+        addition.
+
+        Raises ValueError if a required value is unsupported.
+
+        """
+        required = tuple(
+            (attribute, TriboolArray._codes[Tribool._resolve(value)])
+            for attribute, value in rule.items()
+        )
+        number = len(self._rules)
+        bit = 1 << number
+
+        for attribute, code in required:
+            if attribute not in self._conflicts:
+                self._conflicts[attribute] = [0, 0, 0]
+                self.attributes.append(attribute)
+            conflicts = self._conflicts[attribute]
+            for other in range(3):
+                if other != code:
+                    conflicts[other] |= bit
+
+        self._rules.append(required)
+        self._all |= bit
+        return number
+
+    def match(self, record):
+        """Return frozenset of ids of rules matching `record`.
+
+        `record` maps attributes to values resolved like `Tribool(...)`.
+
+        """
+        codes = TriboolArray._codes
+        resolve = Tribool._resolve
+        get = record.get
+        blocked = 0
+
+        for attribute, conflicts in self._conflicts.items():
+            blocked |= conflicts[codes[resolve(get(attribute))]]
+
+        return frozenset(_bit_indexes(self._all & ~blocked))
+
+    def match_columns(self, columns):
+        """Return list of frozensets of ids of rules matching each record.
+
+        `columns` maps attributes to equal-length TriboolArray columns or
+        iterables of values resolved like `Tribool(...)`. Record `index`
+        consists of the value at `index` in every column. Missing columns
+        are Indeterminate.
+
+        Each column is converted to one bitset of records per Tribool value
+        and each rule intersects the bitsets it requires. The number of
+        Python-level steps is proportional to the total size of the rules
+        plus the number of matches. Each step is a bitwise operation on an
+        integer with one bit per record.
+
+        Raises ValueError if columns differ in length.
+
+        """
+        codes = {}
+        for attribute, column in columns.items():
+            if isinstance(column, TriboolArray):
+                codes[attribute] = column.codes()
+            else:
+                codes[attribute] = bytes(bytearray(
+                    Tribool._convert(column, 'names', TriboolArray._codes)
+                ))
+
+        lengths = set(len(column) for column in codes.values())
+        if len(lengths) > 1:
+            raise ValueError('Columns differ in length')
+        length = lengths.pop() if lengths else 0
+        if not length:
+            return []
+
+        everyone = (1 << length) - 1
+        unknown = TriboolArray._codes[None]
+        records = {}
+        matches = [[] for _ in range(length)]
+
+        for number, rule in enumerate(self._rules):
+            mask = everyone
+            for key in rule:
+                if key not in records:
+                    attribute, code = key
+                    if attribute in codes:
+                        digits = codes[attribute].translate(_digits[code])
+                        records[key] = int(digits[::-1], 2)
+                    elif code == unknown:
+                        records[key] = everyone
+                    else:
+                        records[key] = 0
+                mask &= records[key]
+                if not mask:
+                    break
+            for index in _bit_indexes(mask):
+                matches[index].append(number)
+
+        return [frozenset(numbers) for numbers in matches]
+
+
+_digits = [
+    bytes(bytearray(ord('1') if byte == code else ord('0')
+                    for byte in range(256)))
+    for code in range(3)
+]
+_nonzero = re.compile(b'[^\x00]')
+_byte_bits = [
+    tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)
+]
+
+
+def _bit_indexes(mask):
+    """Return list of indexes of set bits in `mask`.
+
+    Zero bytes of `mask` are skipped without a Python-level step so sparse
+    masks cost steps proportional to their set bits.
+
+    """
+    if not mask:
+        return []
+    digits = '%x' % mask
+    data = bytearray(unhexlify('0' * (len(digits) % 2) + digits))
+    data.reverse()
+    result = []
+    for match in _nonzero.finditer(data):
+        position = match.start()
+        base = position << 3
+        result.extend(base + bit for bit in _byte_bits[data[position]])
+    return result
+
+
 __title__ = 'tribool'
 __version__ = '0.7.3'
 __build__ = 0x000703